@@ -0,0 +1,59 @@
+"""Process-wide models and API clients, created once and shared."""
+import functools
+import os
+import threading
+import config
+
+_lock = threading.RLock()
+
+
+def _shared(factory):
+    """Cache a zero-argument factory so every caller gets the same instance."""
+    cached = functools.lru_cache(maxsize=None)(factory)
+
+    @functools.wraps(factory)
+    def get():
+        with _lock:
+            return cached()
+    return get
+
+
+@_shared
+def get_openai_client():
+    """OpenRouter (OpenAI-compatible) client shared by the parser and narrators."""
+    from openai import OpenAI
+
+    return OpenAI(
+        api_key=config.OPENROUTER_API_KEY,
+        base_url=config.OPENROUTER_BASE_URL
+    )
+
+
+@_shared
+def get_vosk_model():
+    """Vosk speech recognition model."""
+    from vosk import Model
+
+    model_path = config.VOSK_MODEL_PATH
+    if not os.path.exists(model_path):
+        raise RuntimeError(
+            f"Vosk model not found at {model_path}\n"
+            f"Download from: https://alphacephei.com/vosk/models\n"
+            f"Recommended: vosk-model-small-en-us-0.15 (~40MB)"
+        )
+
+    print("[Vosk] Loading model...")
+    model = Model(model_path)
+    print("[Vosk] Model loaded")
+    return model
+
+
+@_shared
+def get_voice_encoder():
+    """Resemblyzer speaker encoder."""
+    from resemblyzer import VoiceEncoder
+
+    print("[Speaker] Loading Resemblyzer encoder...")
+    encoder = VoiceEncoder()
+    print("[Speaker] Resemblyzer encoder loaded")
+    return encoder
@@ -1,5 +1,4 @@
 import numpy as np
-from collections import deque
 from typing import Optional
 import config
 
@@ -7,18 +6,41 @@ import config
 class AudioBuffer:
     """Manages incoming audio chunks and assembles them for processing."""
 
-    def __init__(self, sample_rate: int = config.SAMPLE_RATE):
+    def __init__(
+        self,
+        sample_rate: int = config.SAMPLE_RATE,
+        max_seconds: float = config.BUFFER_MAX_SECONDS
+    ):
         self.sample_rate = sample_rate
-        self.buffer = deque()
+        self.capacity = int(max_seconds * sample_rate)
+        # Raw 16-bit PCM ring buffer, converted to float32 only when read
+        self._ring = np.empty(self.capacity, dtype=np.int16)
+        self._read_pos = 0
+        self._write_pos = 0
         self.total_samples = 0
 
     def add_chunk(self, audio_data: bytes) -> None:
-        """Add a chunk of audio data (16-bit PCM) to the buffer."""
-        audio_array = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32)
-        # Normalize to [-1, 1]
-        audio_array = audio_array / 32768.0
-        self.buffer.append(audio_array)
-        self.total_samples += len(audio_array)
+        """
+        Add a chunk of audio data (16-bit PCM) to the buffer.
+        Once the buffer is full, the oldest audio is dropped.
+        """
+        src = np.frombuffer(audio_data, dtype=np.int16)
+        if len(src) > self.capacity:
+            src = src[-self.capacity:]
+        n = len(src)
+
+        # Write with wrap-around
+        first = min(n, self.capacity - self._write_pos)
+        np.copyto(self._ring[self._write_pos:self._write_pos + first], src[:first])
+        np.copyto(self._ring[:n - first], src[first:])
+        self._write_pos = (self._write_pos + n) % self.capacity
+
+        # Drop the oldest samples if we overwrote them
+        overflow = self.total_samples + n - self.capacity
+        if overflow > 0:
+            self._read_pos = (self._read_pos + overflow) % self.capacity
+            self.total_samples -= overflow
+        self.total_samples += n
 
     def get_audio(self, duration_seconds: float) -> Optional[np.ndarray]:
         """
@@ -30,11 +52,20 @@ class AudioBuffer:
         if self.total_samples < required_samples:
             return None
 
-        # Concatenate chunks
-        all_audio = np.concatenate(list(self.buffer))
+        # Convert the requested span to float32 [-1, 1], handling wrap-around
+        out = np.empty(required_samples, dtype=np.float32)
+        scale = np.float32(1.0 / 32768.0)
+        first = min(required_samples, self.capacity - self._read_pos)
+        np.multiply(
+            self._ring[self._read_pos:self._read_pos + first], scale,
+            out=out[:first], dtype=np.float32
+        )
+        np.multiply(
+            self._ring[:required_samples - first], scale,
+            out=out[first:], dtype=np.float32
+        )
 
-        # Return requested duration
-        return all_audio[:required_samples]
+        return out
 
     def consume(self, duration_seconds: float) -> Optional[np.ndarray]:
         """
@@ -45,26 +76,16 @@ class AudioBuffer:
         if audio is None:
             return None
 
-        samples_to_remove = len(audio)
-
         # Remove consumed samples from buffer
-        while samples_to_remove > 0 and self.buffer:
-            chunk = self.buffer[0]
-            if len(chunk) <= samples_to_remove:
-                self.buffer.popleft()
-                samples_to_remove -= len(chunk)
-                self.total_samples -= len(chunk)
-            else:
-                # Partial consumption
-                self.buffer[0] = chunk[samples_to_remove:]
-                self.total_samples -= samples_to_remove
-                samples_to_remove = 0
+        self._read_pos = (self._read_pos + len(audio)) % self.capacity
+        self.total_samples -= len(audio)
 
         return audio
 
     def clear(self) -> None:
         """Clear the buffer."""
-        self.buffer.clear()
+        self._read_pos = 0
+        self._write_pos = 0
         self.total_samples = 0
 
     def duration_seconds(self) -> float:
@@ -1,3 +1,4 @@
+from math import gcd
 import numpy as np
 import torch
 from scipy import signal
@@ -16,24 +17,39 @@ class AudioProcessor:
         if original_sr == self.target_sample_rate:
             return audio
 
-        # Calculate resampling ratio
-        ratio = self.target_sample_rate / original_sr
-        new_length = int(len(audio) * ratio)
+        # Reduce the rate ratio so the polyphase filter stays small
+        # (e.g. 48000 -> 16000 becomes up=1, down=3)
+        g = gcd(original_sr, self.target_sample_rate)
+        up = self.target_sample_rate // g
+        down = original_sr // g
 
-        resampled = signal.resample(audio, new_length)
-        return resampled.astype(np.float32)
+        resampled = signal.resample_poly(audio, up, down)
+        return resampled.astype(np.float32, copy=False)
 
     def to_mono(self, audio: np.ndarray) -> np.ndarray:
         """Convert stereo audio to mono."""
         if audio.ndim == 1:
             return audio
-        return np.mean(audio, axis=1).astype(np.float32)
+        return np.mean(audio, axis=1, dtype=np.float32)
 
-    def normalize(self, audio: np.ndarray) -> np.ndarray:
-        """Normalize audio to [-1, 1] range."""
-        max_val = np.max(np.abs(audio))
+    def _peak(self, audio: np.ndarray) -> float:
+        """Get the peak absolute amplitude without allocating np.abs(audio)."""
+        if audio.size == 0:
+            return 0.0
+        return max(float(audio.max()), -float(audio.min()))
+
+    def normalize(self, audio: np.ndarray, inplace: bool = False) -> np.ndarray:
+        """
+        Normalize audio to [-1, 1] range.
+        With inplace=True the (float) input array is scaled in place; only
+        use it on buffers nobody else reads.
+        """
+        max_val = self._peak(audio)
         if max_val > 0:
-            return audio / max_val
+            scale = np.float32(1.0 / max_val)
+            if inplace:
+                return np.multiply(audio, scale, out=audio)
+            return audio * scale
         return audio
 
     def to_torch(self, audio: np.ndarray) -> torch.Tensor:
@@ -41,7 +57,7 @@ class AudioProcessor:
         # Pyannote expects (channel, samples) format
         tensor = torch.from_numpy(audio).float()
         if tensor.ndim == 1:
-            tensor = tensor.unsqueeze(0)
+            tensor.unsqueeze_(0)
         return tensor
 
     def prepare_for_pyannote(self, audio: np.ndarray) -> Tuple[torch.Tensor, int]:
@@ -49,9 +65,11 @@ class AudioProcessor:
         Prepare audio for Pyannote processing.
         Returns (tensor, sample_rate) tuple.
         """
-        audio = self.to_mono(audio)
-        audio = self.normalize(audio)
-        tensor = self.to_torch(audio)
+        mono = self.to_mono(audio)
+        # Normalize in place only when to_mono made a new array; the
+        # caller's buffer is also used for transcription
+        mono = self.normalize(mono, inplace=mono is not audio)
+        tensor = self.to_torch(mono)
         return tensor, self.target_sample_rate
 
     def prepare_for_openai(self, audio: np.ndarray) -> bytes:
@@ -60,7 +78,11 @@ class AudioProcessor:
         Returns 16-bit PCM bytes.
         """
         audio = self.to_mono(audio)
-        audio = self.normalize(audio)
-        # Convert to 16-bit PCM
-        audio_int16 = (audio * 32767).astype(np.int16)
-        return audio_int16.tobytes()
+        peak = self._peak(audio)
+        scale = np.float32(32767.0 / peak) if peak > 0 else np.float32(0.0)
+
+        # Normalize and scale to 16-bit range in one pass
+        scaled = np.multiply(audio, scale, dtype=np.float32)
+        np.rint(scaled, out=scaled)
+        np.clip(scaled, -32767, 32767, out=scaled)
+        return scaled.astype(np.int16).tobytes()
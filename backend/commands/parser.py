@@ -1,9 +1,14 @@
 import json
+import logging
+import threading
 import time
 from typing import Optional, List
 from dataclasses import dataclass
 import numpy as np
 import config
+from _models import get_openai_client, get_vosk_model
+
+log = logging.getLogger(__name__)
 
 
 @dataclass
@@ -18,29 +23,31 @@ class VoskTranscriber:
     """Local speech recognition using Vosk (fast, no cloud)."""
 
     def __init__(self):
-        from vosk import Model, KaldiRecognizer
-        import os
-
-        model_path = config.VOSK_MODEL_PATH
-        if not os.path.exists(model_path):
-            raise RuntimeError(
-                f"Vosk model not found at {model_path}\n"
-                f"Download from: https://alphacephei.com/vosk/models\n"
-                f"Recommended: vosk-model-small-en-us-0.15 (~40MB)"
-            )
-
-        print("[Vosk] Loading model...")
-        self._model = Model(model_path)
+        self._model = get_vosk_model()
         self._sample_rate = config.SAMPLE_RATE
-        print("[Vosk] Model loaded")
+        # KaldiRecognizer is not thread-safe, so keep one per worker thread
+        self._local = threading.local()
 
-    def transcribe(self, audio: np.ndarray, sample_rate: int) -> str:
-        """Transcribe audio using Vosk."""
+    def _get_recognizer(self, sample_rate: int):
+        """Get this thread's recognizer for the sample rate, creating it once."""
         from vosk import KaldiRecognizer
 
-        # Create recognizer for this audio
-        rec = KaldiRecognizer(self._model, sample_rate)
-        rec.SetWords(False)  # Don't need word-level timing
+        recognizers = getattr(self._local, "recognizers", None)
+        if recognizers is None:
+            recognizers = self._local.recognizers = {}
+
+        rec = recognizers.get(sample_rate)
+        if rec is None:
+            rec = KaldiRecognizer(self._model, sample_rate)
+            rec.SetWords(False)  # Don't need word-level timing
+            recognizers[sample_rate] = rec
+        return rec
+
+    def transcribe(self, audio: np.ndarray, sample_rate: int) -> str:
+        """Transcribe audio using Vosk."""
+        # Reuse the recognizer instead of rebuilding it for every utterance
+        rec = self._get_recognizer(sample_rate)
+        rec.Reset()
 
         # Convert float32 [-1, 1] to int16 PCM
         if audio.dtype == np.float32:
@@ -109,6 +116,16 @@ class CommandParser:
 
     def __init__(self):
         self.valid_commands = set(config.VALID_COMMANDS)
+        # Single word -> command table; direct matches take priority
+        # over phonetic ones (e.g. "upper" is itself a valid command)
+        self._command_lookup = {
+            word: cmd for word, cmd in PHONETIC_MATCHES.items()
+            if cmd in self.valid_commands
+        }
+        self._command_lookup.update((cmd, cmd) for cmd in self.valid_commands)
+        # Shared LLM client (used for dance choreography)
+        self.client = get_openai_client()
+        self.model = config.LLM_MODEL
         print("[CommandParser] Using Vosk (local) for transcription")
         self._transcriber = VoskTranscriber()
 
@@ -118,19 +135,7 @@ class CommandParser:
 
     def _match_command(self, word: str) -> Optional[str]:
         """Match a word to a command (direct or phonetic)."""
-        word = word.lower().strip()
-
-        # Direct match
-        if word in self.valid_commands:
-            return word
-
-        # Phonetic match
-        if word in PHONETIC_MATCHES:
-            matched = PHONETIC_MATCHES[word]
-            if matched in self.valid_commands:
-                return matched
-
-        return None
+        return self._command_lookup.get(word.lower().strip())
 
     def parse(self, audio: np.ndarray, sample_rate: int) -> ParsedCommand:
         """Parse audio to extract a single command."""
@@ -140,23 +145,23 @@ class CommandParser:
             transcribe_time = (time.perf_counter() - t0) * 1000
 
             if not raw_text:
-                print(f"[Transcribe] {transcribe_time:.0f}ms (empty)")
+                log.debug("[Transcribe] %.0fms (empty)", transcribe_time)
                 return ParsedCommand(command=None, raw_text=None, confidence=0.0)
 
             # Try to match the whole text first
             cmd = self._match_command(raw_text)
             if cmd:
-                print(f"[Transcribe] {transcribe_time:.0f}ms | Direct match: '{cmd}'")
+                log.debug("[Transcribe] %.0fms | Direct match: '%s'", transcribe_time, cmd)
                 return ParsedCommand(command=cmd, raw_text=raw_text, confidence=0.95)
 
             # Try matching individual words
             for word in raw_text.lower().split():
                 cmd = self._match_command(word)
                 if cmd:
-                    print(f"[Transcribe] {transcribe_time:.0f}ms | Word match: '{cmd}' from '{raw_text}'")
+                    log.debug("[Transcribe] %.0fms | Word match: '%s' from '%s'", transcribe_time, cmd, raw_text)
                     return ParsedCommand(command=cmd, raw_text=raw_text, confidence=0.85)
 
-            print(f"[Transcribe] {transcribe_time:.0f}ms | No match: '{raw_text}'")
+            log.debug("[Transcribe] %.0fms | No match: '%s'", transcribe_time, raw_text)
             return ParsedCommand(command=None, raw_text=raw_text, confidence=0.0)
 
         except Exception as e:
@@ -171,7 +176,7 @@ class CommandParser:
             transcribe_time = (time.perf_counter() - t0) * 1000
 
             if not raw_text:
-                print(f"[Transcribe] {transcribe_time:.0f}ms (empty)")
+                log.debug("[Transcribe] %.0fms (empty)", transcribe_time)
                 return []
 
             # Find all commands in the text
@@ -182,13 +187,14 @@ class CommandParser:
                     commands_found.append(cmd)
 
             if commands_found:
-                print(f"[Transcribe] {transcribe_time:.0f}ms | Found {len(commands_found)} commands: {commands_found} from '{raw_text}'")
+                log.debug("[Transcribe] %.0fms | Found %d commands: %s from '%s'",
+                          transcribe_time, len(commands_found), commands_found, raw_text)
                 return [
                     ParsedCommand(command=cmd, raw_text=raw_text, confidence=0.9)
                     for cmd in commands_found
                 ]
             else:
-                print(f"[Transcribe] {transcribe_time:.0f}ms | No commands in: '{raw_text}'")
+                log.debug("[Transcribe] %.0fms | No commands in: '%s'", transcribe_time, raw_text)
                 return [ParsedCommand(command=None, raw_text=raw_text, confidence=0.0)]
 
         except Exception as e:
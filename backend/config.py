@@ -16,6 +16,8 @@ VOSK_MODEL_PATH = os.path.join(os.path.dirname(__file__), "models", "vosk-model-
 SAMPLE_RATE = 16000
 CHANNELS = 1
 CHUNK_DURATION_MS = 500
+BUFFER_MAX_SECONDS = 30  # Oldest audio is dropped beyond this
+DEBUG_AUDIO = os.getenv("DEBUG_AUDIO", "") == "1"  # Log per-chunk audio diagnostics (DEBUG level)
 
 # Speaker identification (using Resemblyzer - fast local)
 SPEAKER_SIMILARITY_THRESHOLD = 0.40  # Threshold for speaker matching
@@ -1,3 +1,4 @@
+import logging
 import os
 import sys
 import warnings
@@ -23,11 +24,13 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 
 from ws.handler import WebSocketHandler
-from speakers.storage import SpeakerStorage
 import config
 
-# Initialize storage (creates data directory and speakers.json if needed)
-SpeakerStorage()
+# Per-chunk audio diagnostics (volume, timing, speaker scores, transcripts)
+# are logged at DEBUG and only shown with DEBUG_AUDIO=1
+logging.basicConfig(format="%(message)s")
+for _name in ("ws", "speakers", "commands"):
+    logging.getLogger(_name).setLevel(logging.DEBUG if config.DEBUG_AUDIO else logging.INFO)
 
 app = FastAPI(title="PlayEarOne - Voice Command System")
 
@@ -40,7 +43,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# WebSocket handler
+# WebSocket handler; its SpeakerStorage (which creates the data directory
+# and speakers.json if needed) is the one instance the endpoints share
 ws_handler = WebSocketHandler()
 
 # Serve frontend static files
@@ -65,15 +69,13 @@ async def health():
 @app.get("/api/speakers")
 async def list_speakers():
     """List all enrolled speakers."""
-    storage = SpeakerStorage()
-    return {"speakers": storage.list_speaker_names()}
+    return {"speakers": ws_handler.storage.list_speaker_names()}
 
 
 @app.delete("/api/speakers/{name}")
 async def remove_speaker(name: str):
     """Remove an enrolled speaker."""
-    storage = SpeakerStorage()
-    success = storage.remove_speaker(name)
+    success = ws_handler.storage.remove_speaker(name)
     return {"success": success, "name": name}
 
 
@@ -95,6 +97,7 @@ async def update_player_assignments(assignments: dict):
     # Update the runtime config
     config.PLAYER_ASSIGNMENTS.clear()
     config.PLAYER_ASSIGNMENTS.update(assignments)
+    ws_handler.refresh_allowed_speakers()
     return {"success": True, "player_assignments": config.PLAYER_ASSIGNMENTS}
 
 
@@ -3,17 +3,45 @@ import base64
 import time
 import asyncio
 import edge_tts
-from openai import OpenAI
-from typing import Optional
+from typing import Dict, Optional, Tuple
 import config
+from _models import get_openai_client
+
+# Canned lines spoken when commentary generation fails, keyed by game and
+# command so the line always matches the move. Their audio is cached
+# process-wide (keyed by voice and text) so the fallback doesn't wait on
+# TTS. Commands without a line stay silent, as before.
+FALLBACK_LINES = {
+    "pong": {
+        "up": "Paddle up!",
+        "down": "Paddle down!",
+    },
+    "boxing": {
+        "jab": "Quick jab!",
+        "cross": "Straight cross!",
+        "hook": "What a hook!",
+        "uppercut": "Big uppercut!",
+        "upper": "Big uppercut!",
+        "block": "Guard is up!",
+        "guard": "Guard is up!",
+        "dodge": "Slipped it!",
+        "duck": "Ducked under!",
+        "forward": "Pressing forward!",
+        "advance": "Pressing forward!",
+        "back": "Backing off!",
+        "retreat": "Backing off!",
+        "fight": "Let's get it on!",
+    },
+}
+_tts_cache: Dict[Tuple[str, str], str] = {}
+# One fallback preload per game type per process. Holding the task also
+# keeps it from being garbage-collected mid-run.
+_preload_tasks: Dict[str, asyncio.Task] = {}
 
 class Narrator:
     def __init__(self, game_type):
-        # Client for Text (OpenRouter)
-        self.text_client = OpenAI(
-            api_key=config.OPENROUTER_API_KEY,
-            base_url=config.OPENROUTER_BASE_URL
-        )
+        # Client for Text (OpenRouter), shared across narrators
+        self.text_client = get_openai_client()
         self.model = config.LLM_MODEL
         self.last_comment_time = 0
         self.cooldown = 5.0
@@ -34,17 +62,27 @@ class Narrator:
             }
         }
 
+        # Build this game's system message once; it never changes per call
+        prompts = self.game_prompts.get(game_type)
+        if prompts:
+            self._system_message = {"role": "system", "content": prompts["system"]}
+            self._user_template = prompts["user_template"]
+        else:
+            self._system_message = None
+            self._user_template = None
+
     def generate_commentary_text(self, speaker_name: str, action: str) -> Optional[str]:
         """Ask OpenRouter to generate a punchy commentary line."""
+        if self._system_message is None:
+            return None
+
         try:
-            prompts = self.game_prompts.get(self.game_type, self.game_prompts.keys())
-            
-            response = self.text_client.chat.completions.create(     
+            response = self.text_client.chat.completions.create(
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": prompts["system"]},
-                    {"role": "user", "content": prompts["user_template"].format(
-                        speaker=speaker_name, 
+                    self._system_message,
+                    {"role": "user", "content": self._user_template.format(
+                        speaker=speaker_name,
                         action=action
                     )}
                 ],
@@ -60,16 +98,37 @@ class Narrator:
         """Convert text to speech using edge-tts (Free, high quality)."""
         try:
             communicate = edge_tts.Communicate(text, self.voice)
-            audio_data = b""
+            audio_data = bytearray()
             async for chunk in communicate.stream():
                 if chunk["type"] == "audio":
-                    audio_data += chunk["data"]
-            
-            return base64.b64encode(audio_data).decode('utf-8')
+                    audio_data.extend(chunk["data"])
+
+            # Clients receive audio inside JSON text frames, so keep base64
+            return base64.b64encode(memoryview(audio_data)).decode('ascii')
         except Exception as e:
             print(f"Edge-TTS Error: {e}")
             return None
 
+    async def _cached_tts_audio(self, text: str) -> Optional[str]:
+        """Like generate_tts_audio, but reuses audio already generated for this text."""
+        key = (self.voice, text)
+        if key not in _tts_cache:
+            audio_b64 = await self.generate_tts_audio(text)
+            if not audio_b64:
+                return None
+            _tts_cache[key] = audio_b64
+        return _tts_cache[key]
+
+    async def preload_fallbacks(self) -> None:
+        """Generate audio for this game's fallback lines ahead of time."""
+        for line in dict.fromkeys(FALLBACK_LINES.get(self.game_type, {}).values()):
+            await self._cached_tts_audio(line)
+
+    def start_preload(self) -> None:
+        """Start preload_fallbacks in the background, once per game type."""
+        if self.game_type in FALLBACK_LINES and self.game_type not in _preload_tasks:
+            _preload_tasks[self.game_type] = asyncio.create_task(self.preload_fallbacks())
+
     async def get_narration(self, speaker: str, action: str) -> Optional[str]:
         """Orchestrates the text and audio generation."""
         current_time = time.time()
@@ -79,14 +138,21 @@ class Narrator:
         # Update cooldown timestamp BEFORE generation to prevent overlaps
         self.last_comment_time = current_time
 
-        loop = asyncio.get_event_loop()
+        loop = asyncio.get_running_loop()
         text = await loop.run_in_executor(None, self.generate_commentary_text, speaker, action)
         
         if text:
             audio_b64 = await self.generate_tts_audio(text)
             if audio_b64:
                 return audio_b64
-        
+
+        # Fall back to this command's canned line, with cached audio
+        fallback_line = FALLBACK_LINES.get(self.game_type, {}).get(action)
+        if fallback_line:
+            audio_b64 = await self._cached_tts_audio(fallback_line)
+            if audio_b64:
+                return audio_b64
+
         # If generation failed, reset cooldown so we can try again sooner
         self.last_comment_time = current_time - self.cooldown + 1.0
         return None
@@ -1,8 +1,9 @@
 import numpy as np
 import torch
 from typing import Optional, Tuple
-from resemblyzer import VoiceEncoder, preprocess_wav
+from resemblyzer import preprocess_wav
 import config
+from _models import get_voice_encoder
 from .storage import SpeakerStorage
 
 
@@ -14,11 +15,21 @@ class SpeakerEnrollment:
         self._encoder = None
 
     def _load_model(self) -> None:
-        """Lazy load the Resemblyzer encoder."""
+        """Lazy load the Resemblyzer encoder (shared across instances)."""
         if self._encoder is None:
-            print("[Speaker] Loading Resemblyzer encoder...")
-            self._encoder = VoiceEncoder()
-            print("[Speaker] Resemblyzer encoder loaded")
+            self._encoder = get_voice_encoder()
+
+    def warmup(self, sample_rate: int = config.SAMPLE_RATE) -> None:
+        """
+        Load the encoder and run one embedding on a second of silence so the
+        first real utterance doesn't pay model load and lazy torch/CUDA init.
+        """
+        self._load_model()
+        try:
+            self._encoder.embed_utterance(np.zeros(sample_rate, dtype=np.float32))
+            print(f"[Speaker] Encoder warmed up on {self._encoder.device}")
+        except Exception as e:
+            print(f"[Speaker] Encoder warmup failed: {e}")
 
     def extract_embedding(self, audio: torch.Tensor, sample_rate: int) -> np.ndarray:
         """
@@ -43,7 +54,7 @@ class SpeakerEnrollment:
         if audio_np.ndim == 2:
             audio_np = audio_np[0]  # Take first channel
 
-        audio_np = audio_np.astype(np.float32)
+        audio_np = audio_np.astype(np.float32, copy=False)  # Already float32 from the handler
 
         # Preprocess for Resemblyzer (resamples to 16kHz if needed)
         wav = preprocess_wav(audio_np, source_sr=sample_rate)
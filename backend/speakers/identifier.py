@@ -1,3 +1,4 @@
+import logging
 import numpy as np
 import torch
 from typing import Optional, Tuple, List
@@ -6,6 +7,8 @@ import config
 from .enrollment import SpeakerEnrollment
 from .storage import SpeakerStorage
 
+log = logging.getLogger(__name__)
+
 
 @dataclass
 class SpeakerMatch:
@@ -27,15 +30,17 @@ class SpeakerIdentifier:
         self.threshold = threshold
         self._enrollment = SpeakerEnrollment(self.storage)
 
-    def _cosine_similarity(self, a: np.ndarray, b: np.ndarray) -> float:
-        """Compute cosine similarity between two vectors."""
-        norm_a = np.linalg.norm(a)
-        norm_b = np.linalg.norm(b)
-
-        if norm_a == 0 or norm_b == 0:
-            return 0.0
-
-        return float(np.dot(a, b) / (norm_a * norm_b))
+    def _normalize_query(self, embedding: np.ndarray) -> np.ndarray:
+        """
+        L2-normalize a query embedding as float32. The stored matrix is
+        float32, and a float64 query would make numpy upcast (copy) the whole
+        matrix before the product instead of running a single-precision GEMV.
+        """
+        embedding = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        if norm > 0:
+            embedding = embedding * np.float32(1.0 / norm)
+        return embedding
 
     def identify(self, audio: torch.Tensor, sample_rate: int, allowed_speakers: Optional[List[str]] = None) -> SpeakerMatch:
         """
@@ -53,10 +58,9 @@ class SpeakerIdentifier:
         try:
             input_embedding = self._enrollment.extract_embedding(audio, sample_rate)
             # Normalize the embedding
-            embedding_norm = np.linalg.norm(input_embedding)
-            if embedding_norm > 0:
-                input_embedding = input_embedding / embedding_norm
-            print(f"[Speaker ID] Input embedding norm after normalization: {np.linalg.norm(input_embedding):.3f}")
+            input_embedding = self._normalize_query(input_embedding)
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("[Speaker ID] Input embedding norm after normalization: %.3f", np.linalg.norm(input_embedding))
         except Exception as e:
             return SpeakerMatch(
                 name="Unknown",
@@ -64,10 +68,10 @@ class SpeakerIdentifier:
                 is_known=False
             )
 
-        # Get all enrolled speakers
-        speakers = self.storage.get_all_speakers()
+        # Get all enrolled speakers as one normalized (N, D) matrix
+        names, embeddings = self.storage.get_embedding_matrix()
 
-        if not speakers:
+        if not names:
             return SpeakerMatch(
                 name="Unknown",
                 confidence=0.0,
@@ -76,36 +80,24 @@ class SpeakerIdentifier:
 
         # Filter to allowed speakers if specified
         if allowed_speakers:
-            speakers = [s for s in speakers if s["name"] in allowed_speakers]
-            if not speakers:
+            rows = [i for i, name in enumerate(names) if name in allowed_speakers]
+            if not rows:
                 return SpeakerMatch(
                     name="Unknown",
                     confidence=0.0,
                     is_known=False
                 )
+            names = [names[i] for i in rows]
+            embeddings = embeddings[rows]
 
-        # Find best match
-        best_match: Optional[str] = None
-        best_similarity: float = -1.0
-
-        for speaker in speakers:
-            # Ensure stored embedding is normalized
-            stored_embedding = np.array(speaker["embedding"])
-            stored_norm = np.linalg.norm(stored_embedding)
-            if stored_norm > 0:
-                stored_embedding = stored_embedding / stored_norm
-            
-            similarity = self._cosine_similarity(
-                input_embedding,
-                stored_embedding
-            )
-
-            if similarity > best_similarity:
-                best_similarity = similarity
-                best_match = speaker["name"]
+        # Find best match - one matrix-vector product scores every speaker
+        similarities = embeddings @ input_embedding
+        best_index = int(np.argmax(similarities))
+        best_match: Optional[str] = names[best_index]
+        best_similarity: float = float(similarities[best_index])
 
-        # Debug logging
-        print(f"[Speaker ID] Best match: {best_match}, similarity: {best_similarity:.3f}, allowed: {allowed_speakers}")
+        log.debug("[Speaker ID] Best match: %s, similarity: %.3f, allowed: %s",
+                  best_match, best_similarity, allowed_speakers)
 
         # Use lower threshold when restricted to game players
         threshold = config.SPEAKER_GAME_THRESHOLD if allowed_speakers else self.threshold
@@ -140,24 +132,28 @@ class SpeakerIdentifier:
         except Exception:
             return [SpeakerMatch(name="Unknown", confidence=0.0, is_known=False)]
 
-        speakers = self.storage.get_all_speakers()
+        input_embedding = self._normalize_query(input_embedding)
+
+        names, embeddings = self.storage.get_embedding_matrix()
 
-        if not speakers:
+        if not names:
             return [SpeakerMatch(name="Unknown", confidence=0.0, is_known=False)]
 
-        # Calculate similarities for all speakers
-        matches = []
-        for speaker in speakers:
-            similarity = self._cosine_similarity(
-                input_embedding,
-                speaker["embedding"]
+        # Calculate similarities for all speakers at once
+        similarities = embeddings @ input_embedding
+
+        # Partially sort to get the top-k, then order just those
+        k = min(top_k, len(names))
+        if k <= 0:
+            return []
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+
+        return [
+            SpeakerMatch(
+                name=names[i],
+                confidence=float(similarities[i]),
+                is_known=bool(similarities[i] >= self.threshold)
             )
-            matches.append(SpeakerMatch(
-                name=speaker["name"],
-                confidence=similarity,
-                is_known=similarity >= self.threshold
-            ))
-
-        # Sort by confidence and return top-k
-        matches.sort(key=lambda x: x.confidence, reverse=True)
-        return matches[:top_k]
+            for i in top
+        ]
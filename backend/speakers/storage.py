@@ -1,110 +1,412 @@
-import json
+import atexit
 import os
-from datetime import datetime
-from typing import Dict, List, Optional
+import shutil
+import threading
+import time
+import weakref
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
 import numpy as np
+import orjson
 import config
 
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Storages with unflushed changes, written out at interpreter exit
+_pending_flush: "weakref.WeakSet[SpeakerStorage]" = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_pending() -> None:
+    """Write out any storage changes still waiting on their flush timer."""
+    for storage in list(_pending_flush):
+        storage.flush()
+
 
 class SpeakerStorage:
-    """Handles persistence of speaker profiles and embeddings."""
+    """
+    Handles persistence of speaker profiles and embeddings.
+
+    Profiles (name, enrollment time) live in a small JSON index. Embeddings
+    live in a separate raw float32 (N, D) matrix file, row i belonging to
+    the i-th profile, which is memory-mapped when loaded. The index names
+    the matrix file by generation and is always written last, so it is
+    the single atomic commit point for both.
+
+    Changes are applied in memory and written out together shortly after
+    (see FLUSH_DELAY_SECONDS), so bursts of updates cost a single write.
+    Use one instance per file: unflushed changes live only in memory, and
+    another instance's flush would overwrite them.
+    """
+
+    FLUSH_DELAY_SECONDS = 0.1
 
     def __init__(self, filepath: str = config.SPEAKERS_FILE):
         self.filepath = filepath
+        # Parsed index and embedding matrix, keyed by index file stat
+        self._cache: Optional[Dict] = None
+        self._cache_key: Optional[Tuple[int, int]] = None
+        self._names: List[str] = []
+        self._embeddings: np.ndarray = np.empty((0, 0), dtype=np.float32)
+        # Matrix generation and row count the on-disk index refers to
+        self._generation = 0
+        self._disk_rows = 0
+        # Write coalescing state
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._rewrite = False  # Pending changes touch existing rows, not just appends
+        self._flush_timer: Optional[threading.Timer] = None
         self._ensure_file_exists()
 
     def _ensure_file_exists(self) -> None:
         """Create speakers file if it doesn't exist."""
         os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
         if not os.path.exists(self.filepath):
-            self._save_data({"speakers": []})
+            self._set_data({"dim": 0, "speakers": []}, self._embeddings)
+            self.flush()
 
     def _load_data(self) -> Dict:
-        """Load speakers data from file."""
-        with open(self.filepath, "r") as f:
-            return json.load(f)
+        """
+        Load the speakers index and map the embedding matrix, re-reading
+        only when the index file has changed.
+        """
+        with self._lock:
+            # Unflushed changes are newer than anything on disk
+            if self._dirty:
+                return self._cache
+
+            key = self._file_key()
+            if self._cache is None or key != self._cache_key:
+                with open(self.filepath, "rb") as f:
+                    data = orjson.loads(f.read())
+                self._generation = data.get("generation", 0)
+
+                # Older files kept each embedding inline in the JSON
+                if any("embedding" in speaker for speaker in data["speakers"]):
+                    self._migrate_inline_embeddings(data)
+                    self.flush()
+                    return self._cache
+
+                count, dim = len(data["speakers"]), data.get("dim", 0)
+                self._disk_rows = count
+                embeddings = self._map_embeddings(count, dim)
+                if embeddings is None:
+                    print(f"[Storage] {self._matrix_path(self._generation)} doesn't hold the {count}x{dim} "
+                          f"matrix {self.filepath} expects; ignoring enrolled speakers (re-enroll them)")
+                    data = {"dim": 0, "generation": self._generation, "speakers": []}
+                    embeddings = np.empty((0, 0), dtype=np.float32)
+                    # Leave the unusable matrix in place; the next write starts a new generation
+                    self._disk_rows = 0
+                    self._rewrite = True
+
+                self._embeddings = embeddings
+                self._names = [speaker["name"] for speaker in data["speakers"]]
+                self._cache = data
+                self._cache_key = key
+            return self._cache
+
+    def _matrix_path(self, generation: int) -> str:
+        """Path of the embedding matrix file for an index generation."""
+        return f"{os.path.splitext(self.filepath)[0]}.{generation}.f32"
+
+    def _map_embeddings(self, count: int, dim: int) -> Optional[np.ndarray]:
+        """
+        Memory-map the first `count` rows of the current generation's matrix
+        file. Returns None if the file is missing or too short, since its
+        rows can't be trusted to line up with the profiles. A longer file is
+        fine: rows appended past `count` belong to an index write that never
+        happened, and the next append overwrites them.
+        """
+        if count == 0:
+            return np.empty((0, dim), dtype=np.float32)
+        path = self._matrix_path(self._generation)
+        expected = count * dim * np.dtype(np.float32).itemsize
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return None
+        if dim == 0 or size < expected:
+            return None
+        return np.memmap(path, dtype=np.float32, mode="r", shape=(count, dim))
+
+    def _migrate_inline_embeddings(self, data: Dict) -> None:
+        """
+        Move embeddings stored inline in the JSON into the matrix file. The
+        original file is kept as <file>.bak. Profiles whose embedding is
+        missing, malformed or not the most common length are skipped.
+        """
+        shutil.copyfile(self.filepath, self.filepath + ".bak")
+
+        lengths = Counter(
+            len(speaker["embedding"]) for speaker in data["speakers"]
+            if isinstance(speaker.get("embedding"), list) and speaker["embedding"]
+        )
+        dim = lengths.most_common(1)[0][0] if lengths else 0
+
+        speakers, rows = [], []
+        for speaker in data["speakers"]:
+            embedding = speaker.pop("embedding", None)
+            try:
+                if not isinstance(embedding, list) or len(embedding) != dim:
+                    raise ValueError(f"expected {dim} values")
+                rows.append(self._normalize(embedding))
+            except (TypeError, ValueError) as e:
+                print(f"[Storage] Skipping '{speaker.get('name')}' while migrating {self.filepath}: {e}")
+                continue
+            speakers.append(speaker)
+
+        embeddings = np.stack(rows) if rows else np.empty((0, 0), dtype=np.float32)
+        self._set_data({**data, "dim": dim if rows else 0, "speakers": speakers}, embeddings)
+        self._disk_rows = 0
+
+    def _set_data(self, data: Dict, embeddings: np.ndarray, append_only: bool = False) -> None:
+        """
+        Replace the in-memory speakers data and schedule a flush to disk.
+        Pass append_only=True when existing rows are unchanged and only new
+        ones were added, so the flush can append instead of rewriting.
+        """
+        with self._lock:
+            if not append_only:
+                self._rewrite = True
+            # Every index write also converts any older profiles it carries
+            data = {**data, "speakers": [self._upgrade_profile(speaker) for speaker in data["speakers"]]}
+            self._cache = data
+            self._names = [speaker["name"] for speaker in data["speakers"]]
+            self._embeddings = embeddings
+            self._dirty = True
+            _pending_flush.add(self)
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.FLUSH_DELAY_SECONDS, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def flush(self) -> None:
+        """
+        Write pending changes to disk now.
+
+        Appends go into the current matrix file past the rows the index
+        refers to. Any other change writes a new generation of the matrix
+        file. Either way the index is swapped in last with os.replace, so a
+        crash leaves the old or the new state, never a mix. Memory maps of
+        the rows an index referred to stay valid.
+        """
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._dirty:
+                return
+
+            embeddings = np.ascontiguousarray(self._embeddings, dtype=np.float32)
+            old_generation = self._generation
+            if self._rewrite:
+                generation = old_generation + 1
+                self._replace_file(self._matrix_path(generation), embeddings.tobytes())
+            else:
+                generation = old_generation
+                self._append_rows(self._matrix_path(generation), self._disk_rows, embeddings[self._disk_rows:])
 
-    def _save_data(self, data: Dict) -> None:
-        """Save speakers data to file."""
-        with open(self.filepath, "w") as f:
-            json.dump(data, f, indent=2)
+            self._cache = {**self._cache, "generation": generation}
+            self._replace_file(self.filepath, orjson.dumps(self._cache))
+            self._cache_key = self._file_key()
+            if generation != old_generation:
+                try:
+                    os.remove(self._matrix_path(old_generation))
+                except OSError:
+                    pass
+
+            self._generation = generation
+            self._disk_rows = len(embeddings)
+            self._dirty = False
+            self._rewrite = False
+            _pending_flush.discard(self)
+
+    @staticmethod
+    def _append_rows(path: str, start_row: int, rows: np.ndarray) -> None:
+        """Write rows into a matrix file starting at row `start_row`."""
+        offset = start_row * rows.shape[1] * rows.itemsize
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            # Drop rows left by an append whose index write never happened
+            f.truncate(offset)
+            f.seek(offset)
+            f.write(rows.tobytes())
+
+    @staticmethod
+    def _replace_file(path: str, payload: bytes) -> None:
+        """Write a file via a temporary file and an atomic rename."""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        """L2-normalize an embedding as a float32 row."""
+        embedding = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(embedding)
+        if norm > 0:
+            return embedding / norm
+        return embedding.copy()
+
+    @staticmethod
+    def _check_dim(embedding: np.ndarray, dim: int) -> None:
+        """Reject embeddings that don't match the stored matrix width."""
+        if dim and len(embedding) != dim:
+            raise ValueError(f"Embedding has {len(embedding)} dimensions, expected {dim}")
+
+    @staticmethod
+    def _format_enrolled_at(speaker: Dict) -> str:
+        """
+        ISO-8601 enrollment time. Stored as integer nanoseconds and only
+        formatted when read; older profiles kept the ISO string itself.
+        """
+        if "enrolled_at_ns" not in speaker:
+            return speaker["enrolled_at"]
+        seconds, nanos = divmod(speaker["enrolled_at_ns"], 1_000_000_000)
+        enrolled = datetime.fromtimestamp(seconds, tz=timezone.utc).replace(microsecond=nanos // 1000)
+        return enrolled.isoformat(timespec="microseconds").replace("+00:00", "Z")
+
+    @staticmethod
+    def _upgrade_profile(speaker: Dict) -> Dict:
+        """
+        Convert an older profile's ISO enrolled_at string to enrolled_at_ns.
+        Profiles that are already converted, or whose string doesn't parse,
+        are returned unchanged.
+        """
+        if "enrolled_at_ns" in speaker or "enrolled_at" not in speaker:
+            return speaker
+        try:
+            enrolled = datetime.fromisoformat(speaker["enrolled_at"].replace("Z", "+00:00"))
+        except (AttributeError, ValueError):
+            return speaker
+        if enrolled.tzinfo is None:
+            enrolled = enrolled.replace(tzinfo=timezone.utc)
+        micros = (enrolled - _EPOCH) // timedelta(microseconds=1)
+        profile = {k: v for k, v in speaker.items() if k != "enrolled_at"}
+        profile["enrolled_at_ns"] = micros * 1000
+        return profile
+
+    def _file_key(self) -> Tuple[int, int]:
+        """Identify the current file contents by modification time and size."""
+        st = os.stat(self.filepath)
+        return st.st_mtime_ns, st.st_size
 
     def add_speaker(self, name: str, embedding: np.ndarray) -> bool:
         """
         Add a new speaker profile.
         Returns False if speaker with same name already exists.
         """
-        data = self._load_data()
+        with self._lock:
+            data = self._load_data()
 
-        # Check for duplicate name
-        for speaker in data["speakers"]:
-            if speaker["name"].lower() == name.lower():
-                return False
+            # Check for duplicate name
+            for speaker in data["speakers"]:
+                if speaker["name"].lower() == name.lower():
+                    return False
+
+            embedding = self._normalize(embedding)
+            if data["speakers"]:
+                self._check_dim(embedding, data["dim"])
+                embeddings = np.vstack([self._embeddings, embedding])
+            else:
+                embeddings = embedding[np.newaxis, :]
 
-        speaker_profile = {
-            "name": name,
-            "enrolled_at": datetime.utcnow().isoformat() + "Z",
-            "embedding": embedding.tolist()
-        }
+            speaker_profile = {
+                "name": name,
+                "enrolled_at_ns": time.time_ns()
+            }
 
-        data["speakers"].append(speaker_profile)
-        self._save_data(data)
-        return True
+            self._set_data({
+                **data,
+                "dim": len(embedding),
+                "speakers": data["speakers"] + [speaker_profile]
+            }, embeddings, append_only=bool(data["speakers"]))
+            return True
 
     def get_speaker(self, name: str) -> Optional[Dict]:
         """Get a speaker profile by name."""
-        data = self._load_data()
-        for speaker in data["speakers"]:
-            if speaker["name"].lower() == name.lower():
-                return {
-                    "name": speaker["name"],
-                    "enrolled_at": speaker["enrolled_at"],
-                    "embedding": np.array(speaker["embedding"], dtype=np.float32)
-                }
-        return None
+        with self._lock:
+            data = self._load_data()
+            for i, speaker in enumerate(data["speakers"]):
+                if speaker["name"].lower() == name.lower():
+                    return {
+                        "name": speaker["name"],
+                        "enrolled_at": self._format_enrolled_at(speaker),
+                        "enrolled_at_ns": speaker.get("enrolled_at_ns"),
+                        "embedding": self._embeddings[i]
+                    }
+            return None
 
     def get_all_speakers(self) -> List[Dict]:
         """Get all speaker profiles with embeddings as numpy arrays."""
-        data = self._load_data()
-        speakers = []
-        for speaker in data["speakers"]:
-            speakers.append({
-                "name": speaker["name"],
-                "enrolled_at": speaker["enrolled_at"],
-                "embedding": np.array(speaker["embedding"], dtype=np.float32)
-            })
-        return speakers
+        with self._lock:
+            data = self._load_data()
+            return [
+                {
+                    "name": speaker["name"],
+                    "enrolled_at": self._format_enrolled_at(speaker),
+                    "enrolled_at_ns": speaker.get("enrolled_at_ns"),
+                    "embedding": self._embeddings[i]
+                }
+                for i, speaker in enumerate(data["speakers"])
+            ]
+
+    def get_embedding_matrix(self) -> Tuple[List[str], np.ndarray]:
+        """
+        Get all speaker names and their L2-normalized embeddings as a single
+        (N, D) float32 matrix, row i belonging to names[i]. Treat both as
+        read-only; changes replace them rather than modifying them.
+        """
+        with self._lock:
+            self._load_data()
+            return self._names, self._embeddings
 
     def list_speaker_names(self) -> List[str]:
         """Get list of all enrolled speaker names."""
-        data = self._load_data()
-        return [speaker["name"] for speaker in data["speakers"]]
+        with self._lock:
+            self._load_data()
+            return list(self._names)
 
     def remove_speaker(self, name: str) -> bool:
         """Remove a speaker by name. Returns True if found and removed."""
-        data = self._load_data()
-        original_count = len(data["speakers"])
-        data["speakers"] = [
-            s for s in data["speakers"]
-            if s["name"].lower() != name.lower()
-        ]
-
-        if len(data["speakers"]) < original_count:
-            self._save_data(data)
-            return True
-        return False
+        with self._lock:
+            data = self._load_data()
+            keep = [
+                i for i, s in enumerate(data["speakers"])
+                if s["name"].lower() != name.lower()
+            ]
+
+            if len(keep) < len(data["speakers"]):
+                self._set_data(
+                    {**data, "speakers": [data["speakers"][i] for i in keep]},
+                    self._embeddings[keep]
+                )
+                return True
+            return False
 
     def update_speaker(self, name: str, new_embedding: np.ndarray) -> bool:
         """Update a speaker's embedding. Returns True if found and updated."""
-        data = self._load_data()
-        for speaker in data["speakers"]:
-            if speaker["name"].lower() == name.lower():
-                speaker["embedding"] = new_embedding.tolist()
-                speaker["enrolled_at"] = datetime.utcnow().isoformat() + "Z"
-                self._save_data(data)
-                return True
-        return False
+        with self._lock:
+            data = self._load_data()
+            for i, speaker in enumerate(data["speakers"]):
+                if speaker["name"].lower() == name.lower():
+                    embedding = self._normalize(new_embedding)
+                    self._check_dim(embedding, data["dim"])
+
+                    # Copy rather than write into a matrix readers may hold
+                    embeddings = np.array(self._embeddings)
+                    embeddings[i] = embedding
+
+                    speakers = list(data["speakers"])
+                    speakers[i] = {
+                        **self._upgrade_profile(speaker),
+                        "enrolled_at_ns": time.time_ns()
+                    }
+                    self._set_data({**data, "speakers": speakers}, embeddings)
+                    return True
+            return False
 
     def clear_all(self) -> None:
         """Remove all speaker profiles."""
-        self._save_data({"speakers": []})
+        self._set_data({"dim": 0, "speakers": []}, np.empty((0, 0), dtype=np.float32))
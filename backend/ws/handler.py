@@ -1,13 +1,16 @@
 import json
 import asyncio
+import functools
+import logging
+import math
+import os
 import time
 from concurrent.futures import ThreadPoolExecutor
-from datetime import datetime
-from typing import Dict, Any, Optional, List
-from dataclasses import dataclass, asdict
+from typing import Dict, Any, Optional, List, Tuple
+from dataclasses import dataclass, field
 from fastapi import WebSocket, WebSocketDisconnect
 import numpy as np
-import torch
+import orjson
 
 from audio import AudioBuffer, AudioProcessor
 from speakers import SpeakerEnrollment, SpeakerIdentifier, SpeakerStorage
@@ -15,25 +18,55 @@ from commands import CommandParser
 import config
 from narrator import Narrator
 
+log = logging.getLogger(__name__)
+
+DANCE_SYSTEM_MESSAGE = {"role": "system", "content": "You are a dance choreographer. Output only valid JSON."}
+
+# Constant control frames, serialized once
+PONG_FRAME = orjson.dumps({"type": "pong"}).decode()
+LISTENING_STARTED_FRAME = orjson.dumps({"type": "listening_started"}).decode()
+LISTENING_STOPPED_FRAME = orjson.dumps({"type": "listening_stopped"}).decode()
+ENROLLMENT_CANCELLED_FRAME = orjson.dumps({"type": "enrollment_cancelled"}).decode()
+DANCE_CANCELLED_FRAME = orjson.dumps({"type": "dance_cancelled"}).decode()
+
+# Second-resolution part of the last timestamp, reused within the same second
+_ts_second: Optional[int] = None
+_ts_prefix = ""
+
+
+def _utc_timestamp() -> str:
+    """Current UTC time as ISO-8601 with microseconds and a Z suffix."""
+    global _ts_second, _ts_prefix
+    second, micros = divmod(time.time_ns() // 1000, 1_000_000)
+    if second != _ts_second:
+        _ts_second = second
+        _ts_prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+    return f"{_ts_prefix}.{micros:06d}Z"
+
+
 @dataclass
-class CommandResult:
-    """Result sent back to client."""
-    timestamp: str
-    speaker: str
-    speaker_confidence: float
-    command: Optional[str]
-    raw_text: Optional[str]
-    command_confidence: float
-    volume: float  # 0.0 to 1.0
-    speech_duration: float  # How long they've been speaking (seconds)
-
-    def to_dict(self) -> Dict[str, Any]:
-        d = asdict(self)
-        # Convert numpy floats to Python floats for JSON serialization
-        for key, value in d.items():
-            if isinstance(value, (np.floating, np.integer)):
-                d[key] = float(value)
-        return d
+class ConnState:
+    """Per-connection state, fetched once per message."""
+    conn_id: int
+    narrator: Narrator
+    game_type: str = "pong"
+    mode: str = "frontend"  # "game" or "frontend"
+    buffer: AudioBuffer = field(default_factory=AudioBuffer)
+    enrollment_buffer: AudioBuffer = field(default_factory=AudioBuffer)
+    enrolling: bool = False  # Audio goes to enrollment_buffer instead of buffer
+
+    # Speech duration tracking (time.monotonic()), keyed by speaker name
+    speech_start_time: Dict[str, Optional[float]] = field(default_factory=dict)
+    last_speech_time: Dict[str, float] = field(default_factory=dict)
+
+    # Dance mode
+    dance_recording: bool = False
+    dance_processing: bool = False  # Recording finished, transcript/plan in flight
+    dance_buffer: Optional[AudioBuffer] = None
+    dance_start_time: float = 0.0
+    dance_next_progress: float = 0.0  # When to send the next progress update
+    dance_cooldown_until: float = 0.0  # Ignore audio processing briefly after dance
+    dance_task: Optional[asyncio.Task] = None  # Processes the dance when time is up
 
 
 class WebSocketHandler:
@@ -46,39 +79,36 @@ class WebSocketHandler:
         self.command_parser = CommandParser()
         self.audio_processor = AudioProcessor()
 
-        # Thread pool for parallel processing
-        self.executor = ThreadPoolExecutor(max_workers=2)
+        # Load the speaker encoder now instead of on the first utterance
+        # (the encoder is shared, so this also warms up the identifier)
+        self.enrollment.warmup()
+
+        # One pool for all blocking work (speaker ID, transcription, enrollment)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(2, (os.cpu_count() or 1) // 2),
+            thread_name_prefix="audio"
+        )
+
+        # Speakers game-mode identification is restricted to (None = anyone)
+        self._allowed_speakers: Optional[List[str]] = None
+        self.refresh_allowed_speakers()
 
         # Per-connection state
-        self.buffers: Dict[int, AudioBuffer] = {}
-        self.enrollment_buffers: Dict[int, AudioBuffer] = {}
-        
-        # Per-connection mode: "game" or "frontend" (default)
-        self.connection_modes: Dict[int, str] = {}
-        self.narrators: Dict[int, Narrator] = {}
-        self.game_types: Dict[int, str] = {}
-
-        # Track speech duration per speaker per connection
-        self.speech_start_time: Dict[tuple, Optional[float]] = {}
-        self.last_speech_time: Dict[tuple, float] = {}
-        
-        # Dance mode state (per connection)
-        self.dance_recording: Dict[int, bool] = {}
-        self.dance_buffers: Dict[int, list] = {}
-        self.dance_start_time: Dict[int, float] = {}
-        self.dance_cooldown: Dict[int, float] = {}  # Ignore audio processing briefly after dance
+        self.conns: Dict[int, ConnState] = {}
+
         self.dance_expected_duration = 30.0  # seconds
+        self.dance_transcribe_timeout = 20.0  # seconds
+        self.dance_llm_timeout = 20.0  # seconds (the API call itself gives up at 15s)
 
     async def handle_connection(self, websocket: WebSocket) -> None:
         """Main handler for a WebSocket connection."""
         await websocket.accept()
         conn_id = id(websocket)
-        self.buffers[conn_id] = AudioBuffer()
-        self.enrollment_buffers[conn_id] = AudioBuffer()
-        
+
         # Create default narrator (will be replaced if client specifies game type)
-        self.narrators[conn_id] = Narrator(game_type="pong")
-        self.game_types[conn_id] = "pong"
+        state = ConnState(conn_id=conn_id, narrator=Narrator(game_type="pong"))
+        self.conns[conn_id] = state
+        state.narrator.start_preload()
 
         try:
             while True:
@@ -89,10 +119,10 @@ class WebSocketHandler:
                     break
 
                 if "bytes" in message:
-                    await self._handle_audio(websocket, message["bytes"])
+                    await self._handle_audio(websocket, state, message["bytes"])
 
                 elif "text" in message:
-                    await self._handle_control(websocket, json.loads(message["text"]))
+                    await self._handle_control(websocket, state, orjson.loads(message["text"]))
 
         except (WebSocketDisconnect, RuntimeError) as e:
             print(f"[WebSocket] Connection {conn_id} closed: {e}")
@@ -102,28 +132,27 @@ class WebSocketHandler:
             traceback.print_exc()
         finally:
             # Cleanup
-            self.buffers.pop(conn_id, None)
-            self.enrollment_buffers.pop(conn_id, None)
-            self.connection_modes.pop(conn_id, None)
-            self.narrators.pop(conn_id, None)
-            self.game_types.pop(conn_id, None)
+            self._cancel_dance_timer(state)
+            self.conns.pop(conn_id, None)
             print(f"[WebSocket] Cleaned up connection {conn_id}")
 
-    async def _handle_control(self, websocket: WebSocket, message: Dict[str, Any]) -> None:
+    async def _handle_control(self, websocket: WebSocket, state: ConnState, message: Dict[str, Any]) -> None:
         """Handle control messages from client."""
         msg_type = message.get("type")
-        conn_id = id(websocket)
+        conn_id = state.conn_id
 
         if msg_type == "start_listening":
             # Get game type from message and update narrator if specified
             game_type = message.get("game")
-            if game_type and game_type != self.game_types.get(conn_id):
+            if game_type and game_type != state.game_type:
                 print(f"[WebSocket] Connection {conn_id} switching to {game_type}")
-                self.game_types[conn_id] = game_type
-                self.narrators[conn_id] = Narrator(game_type=game_type)
+                state.game_type = game_type
+                state.narrator = Narrator(game_type=game_type)
+                state.narrator.start_preload()
             
-            self.buffers[conn_id] = AudioBuffer()
-            await self._send_message(websocket, {"type": "listening_started"})
+            state.buffer = AudioBuffer()
+            state.enrolling = False
+            await self._send_frame(websocket, LISTENING_STARTED_FRAME)
 
         elif msg_type == "start_enrollment":
             name = message.get("name", "").strip()
@@ -131,7 +160,8 @@ class WebSocketHandler:
                 await self._send_error(websocket, "Name is required for enrollment")
                 return
 
-            self.enrollment_buffers[conn_id] = AudioBuffer()
+            state.enrollment_buffer = AudioBuffer()
+            state.enrolling = True
 
             await self._send_message(websocket, {
                 "type": "enrollment_started",
@@ -141,11 +171,12 @@ class WebSocketHandler:
 
         elif msg_type == "complete_enrollment":
             name = message.get("name", "").strip()
-            await self._complete_enrollment(websocket, name)
+            await self._complete_enrollment(websocket, state, name)
 
         elif msg_type == "cancel_enrollment":
-            self.enrollment_buffers[conn_id] = AudioBuffer()
-            await self._send_message(websocket, {"type": "enrollment_cancelled"})
+            state.enrollment_buffer = AudioBuffer()
+            state.enrolling = False
+            await self._send_frame(websocket, ENROLLMENT_CANCELLED_FRAME)
 
         elif msg_type == "list_speakers":
             speakers = self.storage.list_speaker_names()
@@ -164,21 +195,22 @@ class WebSocketHandler:
             })
 
         elif msg_type == "stop_listening":
-            self.buffers[conn_id] = AudioBuffer()
-            await self._send_message(websocket, {"type": "listening_stopped"})
+            state.buffer = AudioBuffer()
+            state.enrolling = False
+            await self._send_frame(websocket, LISTENING_STOPPED_FRAME)
 
         elif msg_type == "start_dance":
-            # Initialize dance recording
-            conn_id = id(websocket)
-            
             # Clear cooldown and buffers to start fresh
-            self.dance_cooldown.pop(conn_id, None)
-            if conn_id in self.buffers:
-                self.buffers[conn_id] = AudioBuffer()
+            state.dance_cooldown_until = 0.0
+            state.buffer = AudioBuffer()
             
-            self.dance_recording[conn_id] = True
-            self.dance_buffers[conn_id] = []
-            self.dance_start_time[conn_id] = time.time()
+            state.dance_recording = True
+            # One preallocated int16 ring per dance, with 10% headroom
+            state.dance_buffer = AudioBuffer(
+                max_seconds=self.dance_expected_duration * 1.1
+            )
+            state.dance_start_time = time.time()
+            state.dance_next_progress = state.dance_start_time + 5.0
             
             await self._send_message(websocket, {
                 "type": "dance_recording_started",
@@ -186,23 +218,19 @@ class WebSocketHandler:
             })
             
             # Schedule dance processing after 30s
-            loop = asyncio.get_event_loop()
-            loop.call_later(
-                self.dance_expected_duration,
-                lambda: asyncio.create_task(self._process_dance(websocket, conn_id))
-            )
+            self._cancel_dance_timer(state)
+            state.dance_task = asyncio.create_task(self._dance_timer(websocket, state))
         
         elif msg_type == "cancel_dance":
             # Allow user to cancel early
-            conn_id = id(websocket)
-            self._cleanup_dance_state(conn_id)
-            await self._send_message(websocket, {"type": "dance_cancelled"})
+            self._cleanup_dance_state(state)
+            await self._send_frame(websocket, DANCE_CANCELLED_FRAME)
         
         elif msg_type == "finish_dance":
             # Process dance immediately (user clicked "Done")
-            conn_id = id(websocket)
-            if self.dance_recording.get(conn_id, False):
-                elapsed = time.time() - self.dance_start_time.get(conn_id, 0)
+            if state.dance_recording:
+                self._cancel_dance_timer(state)
+                elapsed = time.time() - state.dance_start_time
                 print(f"[Dance] User finished early at {elapsed:.1f}s")
                 
                 # Minimum 3 seconds required
@@ -211,110 +239,87 @@ class WebSocketHandler:
                         "type": "dance_error",
                         "message": "Please record at least 3 seconds of description."
                     })
-                    self._cleanup_dance_state(conn_id)
+                    self._cleanup_dance_state(state)
                 else:
                     # Process immediately
-                    await self._process_dance(websocket, conn_id)
+                    await self._process_dance(websocket, state)
 
         elif msg_type == "set_mode":
-            conn_id = id(websocket)
             mode = message.get("mode", "frontend")
-            self.connection_modes[conn_id] = mode
+            state.mode = mode
             print(f"[Mode] Connection {conn_id} set to '{mode}'")
 
         elif msg_type == "ping":
-            await self._send_message(websocket, {"type": "pong"})
-
-    async def _handle_audio(self, websocket: WebSocket, audio_bytes: bytes) -> None:
-        """Handle incoming audio data."""
-        conn_id = id(websocket)
-
-        # Add to both buffers (enrollment and live)
-        if conn_id in self.buffers:
-            self.buffers[conn_id].add_chunk(audio_bytes)
+            await self._send_frame(websocket, PONG_FRAME)
 
-        if conn_id in self.enrollment_buffers:
-            self.enrollment_buffers[conn_id].add_chunk(audio_bytes)
-        
-        # If dance recording active, save chunks
-        if self.dance_recording.get(conn_id, False):
-            # Convert bytes to numpy array
-            audio_array = np.frombuffer(audio_bytes, dtype=np.int16).astype(np.float32) / 32768.0
-            self.dance_buffers[conn_id].append(audio_array)
+    async def _handle_audio(self, websocket: WebSocket, state: ConnState, audio_bytes: bytes) -> None:
+        """Handle incoming audio data. Each chunk goes to the one buffer the current mode reads."""
+        # If dance recording active, save chunks (live audio isn't processed meanwhile)
+        if state.dance_recording:
+            # Keep raw PCM; it's converted once when the dance is processed
+            state.dance_buffer.add_chunk(audio_bytes)
             
             # Send progress update every 5 seconds
-            elapsed = time.time() - self.dance_start_time[conn_id]
-            if int(elapsed) % 5 == 0 and elapsed > 0 and int(elapsed * 10) % 10 == 0:  # Once per 5s
+            now = time.time()
+            if now >= state.dance_next_progress:
+                state.dance_next_progress += 5.0
+                elapsed = now - state.dance_start_time
                 await self._send_message(websocket, {
                     "type": "dance_recording_progress",
                     "elapsed": elapsed,
                     "remaining": self.dance_expected_duration - elapsed
                 })
+            return
+
+        # The dance is being transcribed/choreographed; the dancer may still be
+        # talking, so don't let that speech fire commands
+        if state.dance_processing:
+            return
+
+        if state.enrolling:
+            state.enrollment_buffer.add_chunk(audio_bytes)
+            return
+
+        # Drop audio during the cooldown after dance generation to avoid spurious errors/commands
+        if time.time() < state.dance_cooldown_until:
+            return
 
         # Process live audio when we have enough
-        buffer = self.buffers.get(conn_id)
-        if buffer and buffer.duration_seconds() >= 0.5:
-            # Check if we're in cooldown period after dance generation
-            cooldown_until = self.dance_cooldown.get(conn_id, 0)
-            if time.time() < cooldown_until:
-                # Clear buffer but don't process to avoid spurious errors/commands
-                buffer.consume(1.5)
-                return
-            
-            # Don't process if actively recording dance
-            if self.dance_recording.get(conn_id, False):
-                buffer.consume(1.5)
-                return
-                
-            await self._process_audio_chunk(websocket, buffer)
+        state.buffer.add_chunk(audio_bytes)
+        if state.buffer.duration_seconds() >= 0.5:
+            await self._process_audio_chunk(websocket, state)
 
-    async def _process_audio_chunk(self, websocket: WebSocket, buffer: AudioBuffer) -> None:
+    async def _process_audio_chunk(self, websocket: WebSocket, state: ConnState) -> None:
         """Process accumulated audio for command detection."""
         # Get audio from buffer
-        audio = buffer.consume(0.5)
+        audio = state.buffer.consume(0.5)
         if audio is None:
             return
 
-        # Run processing in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        conn_id = id(websocket)
-        results = await loop.run_in_executor(
-            None,
-            self._process_audio_sync,
-            audio,
-            conn_id
-        )
+        # Calculate RMS and volume first (single pass), and skip very
+        # silent audio here, before anything is handed to the audio pool
+        rms, volume = self._rms_and_volume(audio)
+        if rms < self.SILENCE_RMS_THRESHOLD:
+            return
 
-        # Send all detected commands
-        for result in results:
-            player = config.PLAYER_ASSIGNMENTS.get(result.speaker, None)
-            await self._send_message(websocket, {
-                "type": "command",
-                "player": player,
-                **result.to_dict()
-            })
+        messages = await self._process_audio(audio, state, volume)
 
-            if result.command:
-                asyncio.create_task(self._trigger_narration(websocket, result.speaker, result.command))
+        # Send all detected commands
+        for message in messages:
+            await self._send_message(websocket, message)
+            asyncio.create_task(self._trigger_narration(websocket, state, message["speaker"], message["command"]))
 
     # Common Whisper hallucinations on silence (filter these only)
-    SILENCE_HALLUCINATIONS = [
+    SILENCE_HALLUCINATIONS = frozenset({
         "thank you", "thanks for watching", "subscribe",
         "like and subscribe", "thanks for listening",
         "please subscribe", "thank you for watching"
-    ]
+    })
 
-    async def _trigger_narration(self, websocket: WebSocket, speaker: str, command: str):
+    async def _trigger_narration(self, websocket: WebSocket, state: ConnState, speaker: str, command: str):
         """Generates AI audio and sends it to the frontend."""
-        conn_id = id(websocket)
-        narrator = self.narrators.get(conn_id)
-        
-        if not narrator:
-            print(f"[Narrator] No narrator for connection {conn_id}")
-            return
-        
         try:
-            audio_b64 = await narrator.get_narration(speaker, command)
+            audio_b64 = await state.narrator.get_narration(speaker, command)
             if audio_b64:
                 await self._send_message(websocket, {
                     "type": "narrator_audio",
@@ -323,172 +328,143 @@ class WebSocketHandler:
         except Exception as e:
             print(f"[Narrator] Error generating narration: {e}")
 
-    # ... rest of your methods stay exactly the same (no changes needed)
-    def _is_audio_silent(self, audio: np.ndarray, threshold: float = 0.01) -> bool:
-        """Check if audio is mostly silent based on RMS energy."""
-        rms = np.sqrt(np.mean(audio ** 2))
-        return rms < threshold
-
-    def _calculate_volume(self, audio: np.ndarray) -> float:
-        """Calculate normalized volume level (0.0 to 1.0) using RMS."""
-        rms = np.sqrt(np.mean(audio ** 2))
-        
-        # Adjusted thresholds for easier reach of high volumes
-        # Soft speech: 0.005-0.02, Normal: 0.02-0.06, Loud: 0.06+
-        min_threshold = 0.005  # Below this is silence
-        low_threshold = 0.02   # Soft speech
-        mid_threshold = 0.06   # Normal speech
-        high_threshold = 0.10  # Loud speech (reduced from 0.15)
-        
-        print(f"[Volume] RMS: {rms:.4f}", end="")
-        
-        if rms < min_threshold:
-            volume = 0.0
-        elif rms < low_threshold:
-            # 0.005-0.02 -> 0.0-0.33
-            volume = (rms - min_threshold) / (low_threshold - min_threshold) * 0.33
-        elif rms < mid_threshold:
-            # 0.02-0.06 -> 0.33-0.66
-            volume = 0.33 + (rms - low_threshold) / (mid_threshold - low_threshold) * 0.33
-        elif rms < high_threshold:
-            # 0.06-0.10 -> 0.66-1.0
-            volume = 0.66 + (rms - mid_threshold) / (high_threshold - mid_threshold) * 0.34
-        else:
-            volume = 1.0
-        
-        print(f" -> volume: {volume:.2f}")
-        return float(min(1.0, max(0.0, volume)))
-
-    def _get_speech_duration(self, conn_id: int, speaker: str, is_speaking: bool) -> float:
+    SILENCE_RMS_THRESHOLD = 0.01  # Chunks quieter than this are skipped
+
+    # RMS -> volume mapping: silence below 0.005, soft speech 0.005-0.02,
+    # normal 0.02-0.06, loud 0.06-0.10 (full volume at and above 0.10)
+    VOLUME_RMS_POINTS = (0.005, 0.02, 0.06, 0.10)
+    VOLUME_LEVELS = (0.0, 0.33, 0.66, 1.0)
+
+    def _rms_and_volume(self, audio: np.ndarray) -> Tuple[float, float]:
+        """
+        Compute RMS energy and normalized volume (0.0 to 1.0) in one pass
+        over the audio; the RMS also drives the silence check.
+        """
+        # dot() avoids allocating audio ** 2
+        rms = math.sqrt(float(np.dot(audio, audio)) / audio.size)
+        return rms, self._map_rms_to_volume(rms)
+
+    def _map_rms_to_volume(self, rms: float) -> float:
+        """Map RMS energy to a volume level, clamped to 0.0/1.0 outside the range."""
+        volume = float(np.interp(rms, self.VOLUME_RMS_POINTS, self.VOLUME_LEVELS))
+        log.debug("[Volume] RMS: %.4f -> volume: %.2f", rms, volume)
+        return volume
+
+    def _get_speech_duration(self, state: ConnState, speaker: str, is_speaking: bool) -> float:
         """Calculate how long a speaker has been continuously speaking."""
-        import time
-        current_time = time.time()
-        key = (conn_id, speaker)
+        # Monotonic, so clock adjustments can't stretch or shrink a session
+        current_time = time.monotonic()
+        start_time = state.speech_start_time.get(speaker)
         
         if is_speaking:
-            if key not in self.speech_start_time or self.speech_start_time[key] is None:
+            state.last_speech_time[speaker] = current_time
+            if start_time is None:
                 # Start new speech session
-                self.speech_start_time[key] = current_time
-                self.last_speech_time[key] = current_time
+                state.speech_start_time[speaker] = current_time
                 duration = 0.1
-                print(f" [Duration] NEW session, duration: {duration:.2f}s")
+                log.debug(" [Duration] NEW session, duration: %.2fs", duration)
                 return duration
             else:
                 # Continue existing session
-                self.last_speech_time[key] = current_time
-                duration = current_time - self.speech_start_time[key]
+                duration = current_time - start_time
                 # Cap at 1.5 seconds for tighter range
                 capped = min(duration, 1.5)
-                print(f" [Duration] CONTINUE session, duration: {capped:.2f}s (raw: {duration:.2f}s)")
+                log.debug(" [Duration] CONTINUE session, duration: %.2fs (raw: %.2fs)", capped, duration)
                 return capped
         else:
             # Not speaking - reset IMMEDIATELY, no grace period
-            if key in self.speech_start_time and self.speech_start_time[key] is not None:
-                print(f" [Duration] RESET session (not speaking)")
-                self.speech_start_time[key] = None
+            if start_time is not None:
+                log.debug(" [Duration] RESET session (not speaking)")
+                state.speech_start_time[speaker] = None
             return 0.0
 
     def _is_silence_hallucination(self, text: str) -> bool:
         """Check if transcription is a known Whisper silence hallucination."""
         if not text:
             return True
-        text_lower = text.lower().strip().rstrip(".")
-        for phrase in self.SILENCE_HALLUCINATIONS:
-            if text_lower == phrase:
-                return True
-        return False
+        return text.lower().strip().rstrip(".") in self.SILENCE_HALLUCINATIONS
 
-    def _identify_speaker(self, audio_tensor: torch.Tensor, sample_rate: int, conn_id: int = None):
+    def _identify_speaker(self, audio: np.ndarray, mode: str = "frontend"):
         """Run speaker identification (for parallel execution)."""
+        audio_tensor, sample_rate = self.audio_processor.prepare_for_pyannote(audio)
+
         # Only restrict to assigned players when in game mode
-        mode = self.connection_modes.get(conn_id, "frontend") if conn_id else "frontend"
-        if mode == "game" and config.PLAYER_ASSIGNMENTS:
-            allowed_speakers = list(config.PLAYER_ASSIGNMENTS.keys())
-        else:
-            allowed_speakers = None
+        allowed_speakers = self._allowed_speakers if mode == "game" else None
         return self.identifier.identify(audio_tensor, sample_rate, allowed_speakers=allowed_speakers)
 
+    def refresh_allowed_speakers(self) -> None:
+        """Re-read the assigned players; call after config.PLAYER_ASSIGNMENTS changes."""
+        self._allowed_speakers = list(config.PLAYER_ASSIGNMENTS.keys()) or None
+
     def _parse_command(self, audio: np.ndarray, sample_rate: int):
         """Run command parsing (for parallel execution). Returns list of commands."""
         return self.command_parser.parse_multiple(audio, sample_rate)
 
-    def _process_audio_sync(self, audio: np.ndarray, conn_id: int) -> List[CommandResult]:
-        """Synchronous audio processing with parallel speaker ID and transcription.
-        Returns list of CommandResults (may contain multiple if multiple commands detected)."""
+    async def _process_audio(self, audio: np.ndarray, state: ConnState, volume: float) -> List[Dict[str, Any]]:
+        """Audio processing with speaker ID and transcription running in parallel.
+        Returns the "command" messages to send (may contain multiple if multiple commands detected)."""
         try:
-            # Calculate volume first
-            volume = self._calculate_volume(audio)
             # Consider any non-silent audio as speaking
             is_speaking = volume > 0.0
 
-            # Skip very silent audio
-            if self._is_audio_silent(audio):
-                return []
-
             start_time = time.perf_counter()
 
-            # Prepare audio for speaker embedding
-            audio_tensor, sample_rate = self.audio_processor.prepare_for_pyannote(audio)
-
-            # Run speaker ID and command parsing in parallel
-            speaker_future = self.executor.submit(
-                self._identify_speaker, audio_tensor, sample_rate, conn_id
+            # Run speaker ID and command parsing in parallel on the audio pool
+            loop = asyncio.get_running_loop()
+            speaker_match, parsed_list = await asyncio.gather(
+                loop.run_in_executor(self.executor, self._identify_speaker, audio, state.mode),
+                loop.run_in_executor(
+                    self.executor, self._parse_command, audio, self.audio_processor.target_sample_rate
+                )
             )
-            command_future = self.executor.submit(
-                self._parse_command, audio, sample_rate
-            )
-
-            # Wait for both results and measure timing
-            speaker_match = speaker_future.result()
-            speaker_time = time.perf_counter() - start_time
-
-            parsed_list = command_future.result()  # Now returns a list
             total_time = time.perf_counter() - start_time
 
             # Get raw_text from first result if available
             raw_text = parsed_list[0].raw_text if parsed_list else None
 
             # Log timing
-            print(f"[Timing] Speaker ID: {speaker_time*1000:.0f}ms | "
-                  f"Total (parallel): {total_time*1000:.0f}ms | "
-                  f"Text: '{raw_text}'")
+            log.debug("[Timing] Speaker ID + transcription (parallel): %.0fms | Text: '%s'",
+                      total_time * 1000, raw_text)
 
             # Calculate speech duration for this speaker
-            speech_duration = self._get_speech_duration(conn_id, speaker_match.name, is_speaking)
+            speech_duration = self._get_speech_duration(state, speaker_match.name, is_speaking)
 
             # Filter only silence hallucinations
             if self._is_silence_hallucination(raw_text):
                 return []
 
-            # Build results for all detected commands
-            results = []
-            for parsed in parsed_list:
-                if parsed.command:  # Only include actual commands
-                    results.append(CommandResult(
-                        timestamp=datetime.utcnow().isoformat() + "Z",
-                        speaker=speaker_match.name,
-                        speaker_confidence=speaker_match.confidence,
-                        command=parsed.command,
-                        raw_text=parsed.raw_text,
-                        command_confidence=parsed.confidence,
-                        volume=volume,
-                        speech_duration=speech_duration
-                    ))
-
-            return results
+            # Build outbound messages for all detected commands
+            timestamp = _utc_timestamp()
+            speaker = speaker_match.name
+            player = config.PLAYER_ASSIGNMENTS.get(speaker)
+            return [
+                {
+                    "type": "command",
+                    "player": player,
+                    "timestamp": timestamp,
+                    "speaker": speaker,
+                    "speaker_confidence": speaker_match.confidence,
+                    "command": parsed.command,
+                    "raw_text": parsed.raw_text,
+                    "command_confidence": parsed.confidence,
+                    "volume": volume,
+                    "speech_duration": speech_duration
+                }
+                for parsed in parsed_list
+                if parsed.command  # Only include actual commands
+            ]
 
         except Exception as e:
             print(f"Processing error: {e}")
             return []
 
-    async def _complete_enrollment(self, websocket: WebSocket, name: str) -> None:
+    async def _complete_enrollment(self, websocket: WebSocket, state: ConnState, name: str) -> None:
         """Complete speaker enrollment with collected audio."""
-        conn_id = id(websocket)
-        buffer = self.enrollment_buffers.get(conn_id)
-
-        if not buffer:
-            await self._send_error(websocket, "No enrollment in progress")
-            return
+        # Enrollment ends here whatever the outcome, so detach the buffer and
+        # resume normal routing before the first await
+        buffer = state.enrollment_buffer
+        state.enrollment_buffer = AudioBuffer()
+        state.enrolling = False
 
         if buffer.duration_seconds() < 2.0:
             await self._send_error(websocket, "Not enough audio collected")
@@ -505,9 +481,9 @@ class WebSocketHandler:
             audio_tensor, sample_rate = self.audio_processor.prepare_for_pyannote(audio)
 
             # Run enrollment in thread pool
-            loop = asyncio.get_event_loop()
+            loop = asyncio.get_running_loop()
             success, message = await loop.run_in_executor(
-                None,
+                self.executor,
                 self.enrollment.enroll,
                 name,
                 audio_tensor,
@@ -518,12 +494,8 @@ class WebSocketHandler:
             import traceback
             traceback.print_exc()
             await self._send_error(websocket, f"Enrollment failed: {e}")
-            self.enrollment_buffers[conn_id] = AudioBuffer()
             return
 
-        # Clear enrollment buffer
-        self.enrollment_buffers[conn_id] = AudioBuffer()
-
         await self._send_message(websocket, {
             "type": "enrollment_complete",
             "success": success,
@@ -533,16 +505,17 @@ class WebSocketHandler:
 
     async def _send_message(self, websocket: WebSocket, message: Dict[str, Any]) -> None:
         """Send JSON message to client while handling NumPy types."""
-        def default_converter(obj):
-            import numpy as np
-            if isinstance(obj, (np.float32, np.float64)):
-                return float(obj)
-            if isinstance(obj, (np.int32, np.int64)):
-                return int(obj)
-            return str(obj)
+        try:
+            frame = orjson.dumps(message, default=str, option=orjson.OPT_SERIALIZE_NUMPY)
+        except Exception as e:
+            print(f"Websocket Send Error: {e}")
+            return
+        await self._send_frame(websocket, frame.decode())
 
+    async def _send_frame(self, websocket: WebSocket, frame: str) -> None:
+        """Send an already-serialized JSON text frame to client."""
         try:
-            await websocket.send_text(json.dumps(message, default=default_converter))
+            await websocket.send_text(frame)
         except Exception as e:
             print(f"Websocket Send Error: {e}")
 
@@ -565,15 +538,38 @@ class WebSocketHandler:
             "message": error
         })
     
-    async def _process_dance(self, websocket: WebSocket, conn_id: int) -> None:
+    async def _dance_timer(self, websocket: WebSocket, state: ConnState) -> None:
+        """Process the dance once recording time is up, unless cancelled first."""
+        try:
+            await asyncio.sleep(self.dance_expected_duration)
+            # Processing is no longer cancellable as a pending timer
+            state.dance_task = None
+            await self._process_dance(websocket, state)
+        except asyncio.CancelledError:
+            pass
+
+    def _cancel_dance_timer(self, state: ConnState) -> None:
+        """Cancel a pending dance timer, if any."""
+        if state.dance_task is not None:
+            state.dance_task.cancel()
+            state.dance_task = None
+
+    async def _process_dance(self, websocket: WebSocket, state: ConnState) -> None:
         """Process accumulated audio and generate dance plan."""
         try:
             # Check if dance is still active (not already processed or cancelled)
-            if not self.dance_recording.get(conn_id, False):
+            if not state.dance_recording:
                 return
             
-            if not self.dance_buffers.get(conn_id):
+            dance_buffer = state.dance_buffer
+            if not dance_buffer or dance_buffer.total_samples == 0:
                 return
+
+            # Stop recording before the first await, so a repeated "Done"
+            # can't process this dance again while it's being transcribed.
+            # Live audio stays muted until processing ends (see finally)
+            state.dance_recording = False
+            state.dance_processing = True
             
             # Send status update
             await self._send_message(websocket, {
@@ -581,13 +577,30 @@ class WebSocketHandler:
                 "message": "Transcribing your dance..."
             })
             
-            # Concatenate all audio chunks
-            full_audio = np.concatenate(self.dance_buffers[conn_id])
+            # Convert the whole recording to float32 [-1, 1] in one pass
+            full_audio = dance_buffer.get_audio(dance_buffer.duration_seconds())
             
-            # Transcribe using existing Vosk/Deepgram
+            # Transcribe using existing Vosk, off the event loop
             print(f"[Dance] Transcribing {len(full_audio)/config.SAMPLE_RATE:.1f}s of audio")
             transcript_start = time.time()
-            transcript = self.command_parser._transcribe(full_audio, config.SAMPLE_RATE)
+            loop = asyncio.get_running_loop()
+            try:
+                transcript = await asyncio.wait_for(
+                    loop.run_in_executor(
+                        self.executor,
+                        self.command_parser._transcribe,
+                        full_audio,
+                        config.SAMPLE_RATE
+                    ),
+                    self.dance_transcribe_timeout
+                )
+            except asyncio.TimeoutError:
+                print(f"[Dance] ✗ Transcription timed out after {self.dance_transcribe_timeout:.0f}s")
+                await self._send_message(websocket, {
+                    "type": "dance_error",
+                    "message": "Transcription took too long. Please try again."
+                })
+                return
             transcript_time = time.time() - transcript_start
             print(f"[Dance] Transcription complete: {transcript_time:.1f}s → '{transcript[:100]}...'")
             
@@ -597,7 +610,7 @@ class WebSocketHandler:
                     "type": "dance_error",
                     "message": "Could not understand the description. Please try again with clearer speech."
                 })
-                self._cleanup_dance_state(conn_id)
+                self._cleanup_dance_state(state)
                 return
             
             # Generate dance plan with LLM
@@ -625,7 +638,7 @@ class WebSocketHandler:
             # Set cooldown to prevent processing spurious audio during animation
             # Cooldown = dance duration + 2 second buffer for UI interaction
             cooldown_duration = dance_plan.get('duration', 10.0) + 2.0
-            self.dance_cooldown[conn_id] = time.time() + cooldown_duration
+            state.dance_cooldown_until = time.time() + cooldown_duration
             print(f"[Dance] Set audio processing cooldown for {cooldown_duration:.1f}s")
             
             total_time = time.time() - transcript_start
@@ -641,7 +654,12 @@ class WebSocketHandler:
                 "message": f"Processing error: {str(e)}"
             })
         finally:
-            self._cleanup_dance_state(conn_id)
+            # Cleanup also clears the cooldown (for cancels); keep the one set
+            # above so the animation isn't interrupted by spurious commands
+            cooldown_until = state.dance_cooldown_until
+            self._cleanup_dance_state(state)
+            state.dance_cooldown_until = cooldown_until
+            state.dance_processing = False
     
     async def _generate_dance_plan(self, transcript: str) -> Dict[str, Any]:
         """Use LLM to convert transcript to structured dance plan."""
@@ -749,16 +767,23 @@ Return ONLY valid JSON (no markdown, no explanation):
         try:
             llm_start = time.time()
             print(f"[Dance LLM] Sending request to {self.command_parser.model}...")
-            response = self.command_parser.client.chat.completions.create(
-                model=self.command_parser.model,
-                messages=[
-                    {"role": "system", "content": "You are a dance choreographer. Output only valid JSON."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=4000,
-                temperature=0.8,  # More creative
-                response_format={"type": "json_object"},
-                timeout=15.0  # 15 second timeout
+            # Blocking client call, so run it on the default executor (it's
+            # network-bound and shouldn't hold an audio pool thread)
+            loop = asyncio.get_running_loop()
+            response = await asyncio.wait_for(
+                loop.run_in_executor(None, functools.partial(
+                    self.command_parser.client.chat.completions.create,
+                    model=self.command_parser.model,
+                    messages=[
+                        DANCE_SYSTEM_MESSAGE,
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=4000,
+                    temperature=0.8,  # More creative
+                    response_format={"type": "json_object"},
+                    timeout=15.0  # 15 second timeout
+                )),
+                self.dance_llm_timeout
             )
             llm_time = time.time() - llm_start
             print(f"[Dance LLM] ✓ Response received in {llm_time:.2f}s")
@@ -882,6 +907,10 @@ Return ONLY valid JSON (no markdown, no explanation):
             
             return result
             
+        except asyncio.TimeoutError:
+            print(f"[Dance LLM] ✗ Choreography timed out after {self.dance_llm_timeout:.0f}s")
+            print(f"[Dance LLM] Falling back to default dance")
+            return self._get_fallback_dance()
         except json.JSONDecodeError as e:
             print(f"[Dance LLM] ✗ JSON parse error: {e}")
             if 'response_content' in locals():
@@ -915,9 +944,11 @@ Return ONLY valid JSON (no markdown, no explanation):
             ]
         }
     
-    def _cleanup_dance_state(self, conn_id: int) -> None:
+    def _cleanup_dance_state(self, state: ConnState) -> None:
         """Clean up dance recording state."""
-        self.dance_recording.pop(conn_id, None)
-        self.dance_buffers.pop(conn_id, None)
-        self.dance_start_time.pop(conn_id, None)
-        self.dance_cooldown.pop(conn_id, None)
+        self._cancel_dance_timer(state)
+        state.dance_recording = False
+        state.dance_buffer = None
+        state.dance_start_time = 0.0
+        state.dance_next_progress = 0.0
+        state.dance_cooldown_until = 0.0